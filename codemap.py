@@ -10,25 +10,38 @@ Designed for AI coding agents to quickly understand unfamiliar repos.
 
 import ast
 import argparse
+import fnmatch
+import hashlib
 import json
 import os
 import re
+import stat
 import sys
-from collections import defaultdict
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from itertools import chain
 from pathlib import Path
-from typing import Optional
+from typing import AbstractSet, Callable, Iterable, Iterator, Optional, TextIO
+
+try:
+    import hyperscan  # optional: faster JS/TS import scanning
+except ImportError:
+    hyperscan = None
 
 # ── Constants ────────────────────────────────────────────────────────────────
 
-SKIP_DIRS = {
+SKIP_DIRS = frozenset({
     ".git", "__pycache__", "node_modules", ".venv", "venv", "env",
     ".env", "dist", "build", ".tox", ".mypy_cache", ".pytest_cache",
     "htmlcov", ".eggs", ".idea", ".vscode", "coverage",
     ".ruff_cache", ".DS_Store", "__pypackages__", "site-packages",
     "target", "vendor", ".nx",
-}
+})
 
-SKIP_EXTENSIONS = {
+SKIP_EXTENSIONS = frozenset({
     ".pyc", ".pyo", ".pyd", ".so", ".dll", ".dylib", ".exe", ".bin",
     ".jpg", ".jpeg", ".png", ".gif", ".ico", ".webp", ".bmp", ".tiff",
     ".mp3", ".mp4", ".wav", ".avi", ".mov",
@@ -36,15 +49,28 @@ SKIP_EXTENSIONS = {
     ".zip", ".tar", ".gz", ".bz2", ".7z", ".rar",
     ".db", ".sqlite", ".sqlite3",
     ".wasm",
-}
+})
 
-ENTRY_POINT_NAMES = {
+ENTRY_POINT_NAMES = frozenset({
     "main.py", "__main__.py", "app.py", "run.py", "cli.py", "manage.py",
     "server.py", "wsgi.py", "asgi.py", "index.js", "index.ts",
     "app.js", "server.js", "main.js", "main.ts", "main.go", "main.rs",
     "Makefile", "Dockerfile",
+})
+
+# Never text: describe_file() labels these without opening them. The walk
+# already drops SKIP_EXTENSIONS; the rest (fonts, archives, bytecode) are
+# kept in the tree but not worth a read.
+_BINARY_EXTS = SKIP_EXTENSIONS | {
+    ".whl", ".jar", ".class", ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".xz", ".zst", ".svgz", ".npy", ".pkl", ".parquet",
 }
 
+JS_EXTENSIONS = frozenset({".js", ".ts", ".jsx", ".tsx", ".mjs", ".cjs"})
+
+# Optional per-project file of extra fnmatch patterns to leave out of the map
+IGNORE_FILE = ".codemapignore"
+
 LANG_COMMENT = {
     ".py": "#", ".js": "//", ".ts": "//", ".jsx": "//", ".tsx": "//",
     ".go": "//", ".rs": "//", ".java": "//", ".kt": "//",
@@ -54,80 +80,394 @@ LANG_COMMENT = {
     ".r": "#", ".R": "#",
 }
 
+# Line-anchored `from x import ...` / `import a, b as c` statements; the
+# default (non --accurate) import sweep runs this instead of ast.parse
+_RE_PY_IMPORT = re.compile(
+    r'^[ \t]*(?:from[ \t]+(\.+[\w.]*|\w[\w.]*)[ \t]+import\b'
+    r'|import[ \t]+(\w[\w.]*(?:[ \t]*,[ \t]*\w[\w.]*|[ \t]+as[ \t]+\w+)*))',
+    re.MULTILINE,
+)
+_RE_MAIN_GUARD = re.compile(r'^[ \t]*if[ \t(]+__name__[ \t]*==', re.MULTILINE)
+# A column-0 line that starts a new top-level statement (not a clause of
+# the previous one); --accurate parses only up to the first such line after
+# the last import
+_RE_TOP_LEVEL_STMT = re.compile(
+    r'^(?!(?:else|elif|except|finally)\b)[A-Za-z_@]', re.MULTILINE
+)
+
+# ES `import ... from "x"`, CommonJS `require("x")` and dynamic `import("x")`
+# in one alternation, so each source is scanned once
+_RE_JS_IMPORT = re.compile(
+    r'import\s+.*?\s+from\s+["\']([^"\']+)["\']'
+    r'|(?:require|import)\s*\(\s*["\']([^"\']+)["\']\s*\)',
+    re.ASCII,
+)
+# Same pattern over UTF-8 bytes, for the Hyperscan-assisted scan (re.ASCII
+# above keeps \s to ASCII whitespace, as it always is for bytes)
+_RE_JS_IMPORT_BYTES = re.compile(_RE_JS_IMPORT.pattern.encode())
+
 # ── File tree ─────────────────────────────────────────────────────────────────
 
-def _should_skip(name: str, path: Path) -> bool:
-    if name in SKIP_DIRS and path.is_dir():
-        return True
-    if name.startswith(".") and path.is_dir() and name not in {".github"}:
-        return True
-    if path.is_file() and path.suffix in SKIP_EXTENSIONS:
-        return True
-    if path.is_file() and name.endswith((".min.js", ".min.css")):
-        return True
+def _file_suffix(name: str) -> str:
+    """Lower-cased extension of a file name ("" for none or dotfiles)."""
+    dot = name.rfind(".")
+    return name[dot:].lower() if dot > 0 else ""
+
+
+def _should_skip_entry(entry: os.DirEntry, suffix: Optional[str] = None) -> bool:
+    """Return True for entries the map should ignore.
+
+    Works off the type info cached on the scandir entry, so no extra stat
+    is issued for regular files and directories. Callers that already hold
+    the file's suffix can pass it to avoid recomputing it.
+    """
+    name = entry.name
+    if entry.is_dir():
+        return name in SKIP_DIRS or (name.startswith(".") and name not in {".github"})
+    if entry.is_file():
+        if suffix is None:
+            suffix = _file_suffix(name)
+        return suffix in SKIP_EXTENSIONS or name.endswith((".min.js", ".min.css"))
     return False
 
 
+def _load_ignore(root: Path | str) -> Optional[Callable[[str], Optional[re.Match]]]:
+    """Compile root's .codemapignore into one matcher over relative paths.
+
+    One glob per line; blank lines and #-comments are skipped and a
+    trailing "/" is ignored. A pattern without "/" matches an entry's name
+    at any depth, otherwise it matches the path from root. All patterns
+    are folded into a single regex, so each path costs one match call no
+    matter how many patterns there are. Returns None without patterns.
+    """
+    try:
+        with open(os.path.join(str(root), IGNORE_FILE), encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return None
+    parts = []
+    for line in lines:
+        pattern = line.strip().rstrip("/")
+        if not pattern or pattern.startswith("#"):
+            continue
+        if "/" in pattern:
+            parts.append(fnmatch.translate(pattern.lstrip("/")))
+        else:
+            parts.append(r"(?:.*/)?" + fnmatch.translate(pattern))
+    if not parts:
+        return None
+    match = re.compile("|".join(parts)).match
+    if os.sep == "/":
+        return match
+    return lambda rel: match(rel.replace(os.sep, "/"))
+
+
+def _scanwalk(
+    root: Path | str, onerror: Optional[Callable[[str, OSError], None]] = None
+):
+    """Yield (entry, rel_path, suffix) for every non-skipped entry under root.
+
+    Top-down like os.walk, but driven by os.scandir so type checks reuse the
+    d_type already returned by readdir instead of issuing a stat per entry.
+    Entries are visited in name order; symlinked directories are reported
+    but not descended into. Unreadable directories are skipped, after
+    onerror (if given) is called with their path and the error, like
+    os.walk(); so is anything matched by root's .codemapignore.
+    suffix is the lower-cased file extension, computed once here so callers
+    can reuse it ("" for directories).
+    """
+    # scandir joins entry.path onto the directory path it was given, so with
+    # a trailing separator on root every relative path is a plain slice.
+    root_str = os.path.join(str(root), "")
+    root_len = len(root_str)
+    stack = [root_str]
+    # Bound to locals: the loop below runs once per entry in the tree
+    should_skip = _should_skip_entry
+    file_suffix = _file_suffix
+    ignored = _load_ignore(root)
+    while stack:
+        dirpath = stack.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as err:
+            if onerror is not None:
+                onerror(dirpath, err)
+            continue
+        subdirs = []
+        for entry in entries:
+            is_dir = entry.is_dir()
+            suffix = "" if is_dir else file_suffix(entry.name)
+            if should_skip(entry, suffix):
+                continue
+            rel = entry.path[root_len:]
+            if ignored is not None and ignored(rel):
+                continue
+            yield entry, rel, suffix
+            if is_dir and not entry.is_symlink():
+                subdirs.append(entry.path)
+        stack.extend(reversed(subdirs))
+
+
+@dataclass(frozen=True, slots=True)
+class FileInfo:
+    """One kept entry of a project walk, as recorded by _scan_project().
+
+    size and mtime_ns come from the entry's stat (which scandir caches) and
+    are 0 for directories. is_link marks symlinked directories, which are
+    listed but never descended into, and denied marks directories whose
+    listing raised PermissionError. head holds the opening text of a
+    top-level README (see README_NAMES) and is None for everything else.
+    """
+
+    path: str
+    rel: str
+    is_dir: bool
+    size: int
+    suffix: str
+    mtime_ns: int = 0
+    is_link: bool = False
+    head: Optional[str] = None
+    denied: bool = False
+
+
+# Top-level READMEs whose opening is quoted in the overview, by preference
+README_NAMES = ("README.md", "README.rst", "README.txt", "README")
+_README_BYTES = 1200
+
+
+def _scan_project(root: Path | str) -> list[FileInfo]:
+    """Walk root once and return every kept directory and regular file.
+
+    The list is in _scanwalk() order and can be handed to build_file_tree(),
+    find_entry_points(), build_dep_graph(), collect_module_descriptions()
+    and _count_stats() in place of root, so one walk serves them all.
+    Entries that are neither a directory nor a regular file (broken
+    symlinks, sockets) are dropped, as the file tree always did. A
+    top-level README is read here, while the walk is at it, so the
+    overview can quote it without looking it up again.
+    """
+    infos: list[FileInfo] = []
+    append = infos.append
+    # A directory is listed after its own entry was recorded, so a denied
+    # listing marks that FileInfo afterwards (the build_file_tree() marker)
+    dir_index: dict[str, int] = {}
+
+    def onerror(path: str, err: OSError) -> None:
+        i = dir_index.get(path)
+        if i is not None and isinstance(err, PermissionError):
+            infos[i] = replace(infos[i], denied=True)
+
+    for entry, rel, suffix in _scanwalk(root, onerror):
+        if entry.is_dir():
+            dir_index[entry.path] = len(infos)
+            append(FileInfo(entry.path, rel, True, 0, "", 0, entry.is_symlink()))
+            continue
+        try:
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+        except OSError:
+            continue
+        head = None
+        if rel in README_NAMES:
+            head = _read_safe(entry.path, _README_BYTES) or ""
+        append(FileInfo(entry.path, rel, False, st.st_size, suffix, st.st_mtime_ns, head=head))
+    return infos
+
+
+def _walk_infos(root: Path | str | Iterable[FileInfo]) -> Iterable[FileInfo]:
+    """Return root's FileInfo entries, walking it only if it is a path."""
+    if isinstance(root, (str, os.PathLike)):
+        return _scan_project(root)
+    return root
+
+
+def _lower_name(entry: os.DirEntry) -> str:
+    return entry.name.lower()
+
+
+def _info_name(info: FileInfo) -> str:
+    return os.path.basename(info.rel).lower()
+
+
 def build_file_tree(
-    root: Path,
-    prefix: str = "",
+    root: Path | str | Iterable[FileInfo],
     max_depth: int = 6,
-    current_depth: int = 0,
     max_files: int = 300,
-    _counter: Optional[list] = None,
 ) -> list[str]:
-    """Return lines of an ASCII file tree."""
-    if _counter is None:
-        _counter = [0]
+    """Return lines of an ASCII file tree.
 
-    if current_depth > max_depth:
-        return [f"{prefix}... (max depth reached)"]
+    Walks with an explicit stack of per-directory frames rather than
+    recursion, so deep trees cost no Python call frames and cannot hit the
+    recursion limit. At most max_files entries are listed in total.
 
+    root is either a directory, which is listed lazily so the walk stops
+    once max_files entries are shown, or the FileInfo list of an earlier
+    _scan_project() call, which is reused instead of walking again.
+    """
     lines: list[str] = []
-    try:
-        entries = sorted(root.iterdir(), key=lambda p: (p.is_file(), p.name.lower()))
-    except PermissionError:
-        return [f"{prefix}[permission denied]"]
-
-    entries = [e for e in entries if not _should_skip(e.name, e)]
-    dirs = [e for e in entries if e.is_dir()]
-    files = [e for e in entries if e.is_file()]
-    all_entries = dirs + files
-
-    for i, entry in enumerate(all_entries):
-        if _counter[0] >= max_files:
-            lines.append(f"{prefix}... ({len(all_entries) - i} more items truncated)")
-            break
+    count = 0
+    # Frames are (enumerate(entries), len(entries), prefix, depth), with the
+    # directory currently being listed on top. Entries are (name, key,
+    # descend) triples; key is what list_dir() takes for that directory.
+    stack: list[tuple] = []
+
+    if isinstance(root, (str, os.PathLike)):
+        root_len = len(os.path.join(str(root), ""))
+        ignored = _load_ignore(root)
+
+        def list_dir(path):
+            # Partition while listing, then sort each half: directories first
+            dirs: list[os.DirEntry] = []
+            files: list[os.DirEntry] = []
+            with os.scandir(path) as it:
+                for e in it:
+                    if _should_skip_entry(e):
+                        continue
+                    if ignored is not None and ignored(e.path[root_len:]):
+                        continue
+                    if e.is_dir():
+                        dirs.append(e)
+                    elif e.is_file():
+                        files.append(e)
+            dirs.sort(key=_lower_name)
+            files.sort(key=_lower_name)
+            return [(e.name, e.path, not e.is_symlink()) for e in dirs] + [
+                (e.name, None, False) for e in files
+            ]
+        top = root
+    else:
+        subdirs: dict[str, list[FileInfo]] = defaultdict(list)
+        dir_files: dict[str, list[FileInfo]] = defaultdict(list)
+        denied: set[str] = set()
+        for info in root:
+            (subdirs if info.is_dir else dir_files)[os.path.dirname(info.rel)].append(info)
+            if info.denied:
+                denied.add(info.rel)
+
+        def list_dir(rel):
+            if rel in denied:
+                raise PermissionError(rel)
+            dirs = sorted(subdirs.get(rel, ()), key=_info_name)
+            files = sorted(dir_files.get(rel, ()), key=_info_name)
+            return [(os.path.basename(d.rel), d.rel, not d.is_link) for d in dirs] + [
+                (os.path.basename(f.rel), None, False) for f in files
+            ]
+        top = ""
+
+    def push_dir(key, prefix: str, depth: int):
+        if depth > max_depth:
+            lines.append(f"{prefix}... (max depth reached)")
+            return
+        try:
+            all_entries = list_dir(key)
+        except PermissionError:
+            lines.append(f"{prefix}[permission denied]")
+            return
+        stack.append((enumerate(all_entries), len(all_entries), prefix, depth))
+
+    push_dir(top, "", 0)
+    while stack:
+        entries, total, prefix, depth = stack[-1]
+        for i, (name, key, descend) in entries:
+            if count >= max_files:
+                lines.append(f"{prefix}... ({total - i} more items truncated)")
+                stack.pop()
+                break
 
-        is_last = i == len(all_entries) - 1
-        connector = "└── " if is_last else "├── "
-        extension = "    " if is_last else "│   "
+            is_last = i == total - 1
+            connector = "└── " if is_last else "├── "
+            extension = "    " if is_last else "│   "
 
-        lines.append(f"{prefix}{connector}{entry.name}")
-        _counter[0] += 1
+            lines.append(f"{prefix}{connector}{name}")
+            count += 1
 
-        if entry.is_dir():
-            sub = build_file_tree(
-                entry,
-                prefix=prefix + extension,
-                max_depth=max_depth,
-                current_depth=current_depth + 1,
-                max_files=max_files,
-                _counter=_counter,
-            )
-            lines.extend(sub)
+            if descend:
+                # List the subdirectory before resuming this one
+                push_dir(key, prefix + extension, depth + 1)
+                break
+        else:
+            stack.pop()
 
     return lines
 
 
 # ── Module descriptions ───────────────────────────────────────────────────────
 
-def _read_safe(path: Path, max_bytes: int = 8192) -> Optional[str]:
+# Read limits. Python and JS/TS sources are read once at _SOURCE_BYTES and
+# shared by every collector; other files only need the head that holds
+# their first comment; manifests must be whole for json.loads().
+_SOURCE_BYTES = 8192
+_HEAD_BYTES = 4096
+_MANIFEST_BYTES = 65536
+
+
+class _RunContext:
+    """State shared by the collectors of one scan.
+
+    Holds the file reads and Python analyses made so far, so each file is
+    read and analysed once however many collectors look at it, plus the
+    run's options. Every scan builds its own context and hands it down
+    explicitly, so concurrent scans never see each other's state.
+
+    When disk_cache is given, Python analyses missing from the context
+    are looked up there before parsing. accurate selects the AST analysis
+    over the default regex sweep.
+    """
+
+    def __init__(self, disk_cache: Optional["_DiskCache"] = None, accurate: bool = False):
+        self.disk_cache = disk_cache
+        self.accurate = accurate
+        self._reads: dict[tuple[str, int], Optional[str]] = {}
+        self._analyses: dict[str, dict] = {}
+
+    def read(self, path: Path | str, max_bytes: int = _SOURCE_BYTES) -> Optional[str]:
+        """_read_safe(path, max_bytes), reading each (path, limit) once."""
+        key = (str(path), max_bytes)
+        reads = self._reads
+        if key not in reads:
+            reads[key] = _read_safe(path, max_bytes)
+        return reads[key]
+
+    def python_analysis(self, path: Path | str, source: str) -> dict:
+        """Return this run's analysis of source, computed once per path."""
+        key = str(path)
+        analyses = self._analyses
+        if key not in analyses:
+            disk = self.disk_cache
+            if disk is not None:
+                analyses[key] = disk.analyze(key, source, self.accurate)
+            else:
+                analyses[key] = (_analyze_python if self.accurate else _sweep_python)(source)
+        return analyses[key]
+
+
+def _read_safe(path: Path | str, max_bytes: int = _SOURCE_BYTES) -> Optional[str]:
     """Read file text, return None on error or binary."""
+    # A raw fd read skips the BufferedReader + TextIOWrapper setup that
+    # open() performs for every file.
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            raw = os.read(fd, max_bytes)
+        finally:
+            os.close(fd)
+    except OSError:
+        return None
+    # A NUL byte near the start marks a binary file (the file(1)/grep
+    # heuristic); bail out before paying for a failing decode.
+    if b"\x00" in raw[:512]:
+        return None
     try:
-        with open(path, "r", encoding="utf-8", errors="strict") as f:
-            return f.read(max_bytes)
-    except (UnicodeDecodeError, PermissionError, OSError):
+        return raw.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # The byte limit may split a multi-byte character; drop the stub
+        if len(raw) == max_bytes and e.start > max_bytes - 4:
+            try:
+                return raw[:e.start].decode("utf-8")
+            except UnicodeDecodeError:
+                pass
         return None
 
 
@@ -141,20 +481,165 @@ def extract_python_docstring(source: str) -> Optional[str]:
         return ast.get_docstring(tree)
     except SyntaxError:
         pass
+    return _docstring_fallback(source)
+
+
+def _docstring_fallback(source: str) -> Optional[str]:
+    # Scanner fallback: find a string literal at the start of the file
+    # (after a BOM, blank lines, shebang and encoding comments) by walking
+    # an offset forward, then str.find() the closing quotes. Nothing past
+    # the docstring is looked at and no slice is made until the result.
+    n = len(source)
+    pos = 1 if source.startswith("\ufeff") else 0
+    while True:
+        while pos < n and source[pos].isspace():
+            pos += 1
+        if not source.startswith("#", pos):
+            break
+        nl = source.find("\n", pos)
+        if nl < 0:
+            return None
+        pos = nl + 1
+
+    if pos < n and source[pos] in "rRuU":  # r"""...""" / u"""..."""
+        pos += 1
+    quote = source[pos:pos + 3]
+    if quote == '"""' or quote == "'''":
+        end = source.find(quote, pos + 3)
+        if end < 0:
+            return None
+        return source[pos + 3:end].strip()
+    if pos >= n or source[pos] not in "\"'":
+        return None
+
+    # 'One-line docstring.': the closing quote must be on the same line,
+    # skipping backslash escapes, with only a comment after it
+    quote = source[pos]
+    end = pos + 1
+    while end < n and source[end] != quote:
+        if source[end] == "\n":
+            return None
+        end += 2 if source[end] == "\\" else 1
+    if end >= n:
+        return None
+    nl = source.find("\n", end)
+    rest = source[end + 1:nl if nl >= 0 else n].strip()
+    if rest and not rest.startswith("#"):
+        return None
+    return source[pos + 1:end].strip()
+
+
+_TRY_NODES = tuple(getattr(ast, name) for name in ("Try", "TryStar") if hasattr(ast, name))
 
-    # Regex fallback: match triple-quoted string at start of file (skipping
-    # shebang lines, encoding declarations, and blank lines)
-    stripped = source.lstrip()
-    # Skip shebang / encoding comment lines
-    while stripped.startswith("#"):
-        stripped = stripped[stripped.find("\n") + 1:].lstrip()
-
-    m = re.match(r'"""(.*?)"""', stripped, re.DOTALL)
-    if not m:
-        m = re.match(r"'''(.*?)'''", stripped, re.DOTALL)
-    if m:
-        return m.group(1).strip()
-    return None
+
+def _import_prefix(source: str) -> Optional[str]:
+    """Return the head of source that holds all of its imports, or None.
+
+    The prefix ends where the first top-level statement after the last
+    import-looking line begins. None means the whole source is needed:
+    there are no imports to anchor on, nothing follows them, or __name__
+    or "import" appears past the cut (the main guard is usually the last
+    statement, and one-line compounds such as "try: import x" are not
+    caught by the line-anchored import pattern).
+    """
+    last = None
+    for last in _RE_PY_IMPORT.finditer(source):
+        pass
+    if last is None:
+        return None
+    nxt = _RE_TOP_LEVEL_STMT.search(source, source.find("\n", last.end()) + 1 or len(source))
+    if nxt is None:
+        return None
+    rest = source[nxt.start():]
+    if "__name__" in rest or "import" in rest:
+        return None
+    return source[:nxt.start()]
+
+
+def _analyze_python(source: str) -> dict:
+    """Parse Python source once; return its docstring, main guard and imports.
+
+    A single parse serves describe_file, the entry-point collector and the
+    dependency collector. Only module-level statements are visited, plus the
+    bodies of top-level if/try blocks (conditional imports, the main guard
+    itself) - function and class bodies are never descended into.
+
+    Cheap substring checks short-circuit the common negatives: blank files
+    (empty __init__.py) are never parsed, and the statement walk is skipped
+    when the source mentions neither "import" nor "__name__". Where
+    possible only the _import_prefix() of the source is parsed; if that
+    prefix does not parse on its own, the full source is.
+    """
+    main_guard = False
+    imports: list[str] = []
+    if not source.strip():
+        return {"docstring": None, "main_guard": main_guard, "imports": imports}
+
+    tree = None
+    prefix = _import_prefix(source)
+    if prefix is not None:
+        try:
+            tree = ast.parse(prefix)
+        except SyntaxError:
+            pass
+    if tree is None:
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            return {"docstring": _docstring_fallback(source), "main_guard": False, "imports": []}
+
+    check_main = "__name__" in source
+    nodes = list(tree.body) if check_main or "import" in source else []
+    for node in nodes:  # grows as if/try blocks are opened
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                imports.append(alias.name.split(".")[0])
+        elif isinstance(node, ast.ImportFrom):
+            if node.module and node.level == 0:
+                imports.append(node.module.split(".")[0])
+            elif node.level and node.level > 0:
+                imports.append("." * node.level + (node.module or ""))
+        elif isinstance(node, ast.If):
+            test = node.test
+            if (
+                check_main
+                and isinstance(test, ast.Compare)
+                and isinstance(test.left, ast.Name)
+                and test.left.id == "__name__"
+            ):
+                main_guard = True
+            nodes.extend(node.body)
+            nodes.extend(node.orelse)
+        elif isinstance(node, _TRY_NODES):
+            nodes.extend(node.body)
+            for handler in node.handlers:
+                nodes.extend(handler.body)
+            nodes.extend(node.orelse)
+            nodes.extend(node.finalbody)
+    return {"docstring": ast.get_docstring(tree), "main_guard": main_guard, "imports": imports}
+
+
+def _sweep_python(source: str) -> dict:
+    """Regex counterpart of _analyze_python(): same keys, no parse.
+
+    Import statements are matched line by line wherever they appear, so
+    function-level imports and import-like lines inside strings are counted
+    too - an accepted trade for skipping ast.parse on every file. The
+    docstring comes from the same scanner _analyze_python() falls back to.
+    """
+    imports: list[str] = []
+    if "import" in source:
+        for m in _RE_PY_IMPORT.finditer(source):
+            module, names = m.groups()
+            if module is None:
+                for name in names.split(","):
+                    imports.append(name.split()[0].split(".")[0])
+            elif module.startswith("."):
+                imports.append(module)
+            else:
+                imports.append(module.split(".")[0])
+    main_guard = "__name__" in source and _RE_MAIN_GUARD.search(source) is not None
+    return {"docstring": _docstring_fallback(source), "main_guard": main_guard, "imports": imports}
 
 
 def extract_first_comment(source: str, comment_char: str) -> Optional[str]:
@@ -168,16 +653,65 @@ def extract_first_comment(source: str, comment_char: str) -> Optional[str]:
     return None
 
 
-def describe_file(path: Path) -> Optional[str]:
-    """Return a one-line description for a source file."""
-    suffix = path.suffix.lower()
-    source = _read_safe(path)
+# Descriptions kept for the life of the process, so repeated maps (a
+# watcher loop, an editor integration) skip files that have not changed.
+# Maps path -> (mtime_ns, size, accurate, description).
+_DESC_CACHE: dict[str, tuple[int, int, bool, Optional[str]]] = {}
+
+
+def clear_cache() -> None:
+    """Forget all memoized file descriptions."""
+    _DESC_CACHE.clear()
+
+
+def describe_file(path: Path | str, suffix: Optional[str] = None) -> Optional[str]:
+    """Return a one-line description for a source file.
+
+    suffix is the lower-cased extension; it is derived from path when omitted.
+    Results are memoized on the file's mtime and size; see clear_cache().
+    """
+    ctx = _RunContext()
+    try:
+        st = os.stat(path)
+    except OSError:
+        return _describe_uncached(ctx, path, suffix)
+    return _describe_stamped(ctx, str(path), suffix, st.st_mtime_ns, st.st_size)
+
+
+def _describe_stamped(
+    ctx: _RunContext, path: str, suffix: Optional[str], mtime_ns: int, size: int
+) -> Optional[str]:
+    """describe_file() for a caller that already holds the file's stat."""
+    stamp = (mtime_ns, size, ctx.accurate)
+    hit = _DESC_CACHE.get(path)
+    if hit is not None and hit[:3] == stamp:
+        return hit[3]
+    desc = _describe_uncached(ctx, path, suffix)
+    _DESC_CACHE[path] = (*stamp, desc)
+    return desc
+
+
+def _describe_uncached(
+    ctx: _RunContext, path: Path | str, suffix: Optional[str]
+) -> Optional[str]:
+    name = os.path.basename(path)
+    if suffix is None:
+        suffix = _file_suffix(name)
+    if suffix in _BINARY_EXTS:
+        return "[binary or unreadable]"
+    if name == "package.json":
+        max_bytes = _MANIFEST_BYTES
+    elif suffix == ".py" or suffix in JS_EXTENSIONS:
+        max_bytes = _SOURCE_BYTES
+    else:
+        max_bytes = _HEAD_BYTES
+    source = ctx.read(path, max_bytes)
     if source is None:
         return "[binary or unreadable]"
 
     # Python: prefer docstring
     if suffix == ".py":
-        doc = extract_python_docstring(source)
+        doc = ctx.python_analysis(path, source)["docstring"]
         if doc:
             return doc.splitlines()[0].strip()
 
@@ -189,9 +723,9 @@ def describe_file(path: Path) -> Optional[str]:
             return comment
 
     # JSON / TOML: extract name + description fields
-    if path.name in {"package.json", "pyproject.toml", "Cargo.toml"}:
+    if name in {"package.json", "pyproject.toml", "Cargo.toml"}:
         try:
-            if path.name == "package.json":
+            if name == "package.json":
                 data = json.loads(source)
                 parts = []
                 if "name" in data:
@@ -206,101 +740,70 @@ def describe_file(path: Path) -> Optional[str]:
     return None
 
 
-def collect_module_descriptions(root: Path, max_files: int = 200) -> dict[str, str]:
-    """Walk root and return {rel_path: description} for describable files."""
-    descriptions: dict[str, str] = {}
-    count = 0
-    for dirpath, dirnames, filenames in os.walk(root):
-        # Prune skip dirs in-place
-        dirnames[:] = [
-            d for d in dirnames
-            if not _should_skip(d, Path(dirpath) / d)
-        ]
-        for fname in sorted(filenames):
-            fpath = Path(dirpath) / fname
-            if _should_skip(fname, fpath):
-                continue
-            if count >= max_files:
-                break
-            rel = str(fpath.relative_to(root))
-            desc = describe_file(fpath)
-            if desc:
-                descriptions[rel] = desc
-            count += 1
-
-    return descriptions
+def collect_module_descriptions(
+    root: Path | Iterable[FileInfo], max_files: int = 200
+) -> dict[str, str]:
+    """Walk root (or reuse its _scan_project() list) and return {rel_path: description}."""
+    return _scan_repo(root, max_files=max_files, descriptions=True)["descriptions"]
 
 
 # ── Entry points ──────────────────────────────────────────────────────────────
 
-def _has_python_main_guard(source: str) -> bool:
-    try:
-        tree = ast.parse(source)
-        for node in ast.walk(tree):
-            if isinstance(node, ast.If):
-                test = node.test
-                if (
-                    isinstance(test, ast.Compare)
-                    and isinstance(test.left, ast.Name)
-                    and test.left.id == "__name__"
-                ):
-                    return True
-    except SyntaxError:
-        pass
-    return False
-
-
-def find_entry_points(root: Path) -> list[dict]:
+def find_entry_points(root: Path | Iterable[FileInfo]) -> list[dict]:
     """Return list of {path, type, reason} for detected entry points."""
-    entries: list[dict] = []
-    seen: set[str] = set()
+    return _scan_repo(root, entry_points=True)["entry_points"]
+
+
+def _collect_entry_points(
+    ctx: _RunContext, fpath: str, rel: str
+) -> list[tuple[str, str, str]]:
+    """Return the (rel_path, type, reason) entry points contributed by one file."""
+    found: list[tuple[str, str, str]] = []
+    fname = os.path.basename(fpath)
+
+    def add(path: str, kind: str, reason: str):
+        found.append((path, kind, reason))
+
+    # Named entry points
+    if fname in ENTRY_POINT_NAMES:
+        kind = _classify_entry(fname)
+        add(rel, kind, f"canonical entry-point filename `{fname}`")
+
+    # Python main guard
+    if fname.endswith(".py"):
+        source = ctx.read(fpath)
+        if source and ctx.python_analysis(fpath, source)["main_guard"]:
+            add(rel, "python-script", "contains `if __name__ == '__main__'`")
+
+    # package.json main field
+    if fname == "package.json":
+        source = ctx.read(fpath, _MANIFEST_BYTES)
+        if source:
+            fdir = os.path.dirname(fpath)
+            rel_dir = os.path.dirname(rel)
+            try:
+                data = json.loads(source)
+                if "main" in data:
+                    main = data["main"]
+                    if os.path.exists(os.path.join(fdir, main)):
+                        add(
+                            os.path.normpath(os.path.join(rel_dir, main)),
+                            "node-main",
+                            f"referenced as `main` in {rel}",
+                        )
+                    else:
+                        add(rel, "node-config", f"`main` field: {main}")
+                if "bin" in data and isinstance(data["bin"], dict):
+                    for bin_name, bin_path in data["bin"].items():
+                        if os.path.exists(os.path.join(fdir, bin_path)):
+                            bp = os.path.normpath(os.path.join(rel_dir, bin_path))
+                        else:
+                            bp = rel
+                        add(bp, "cli-binary", f"npm bin `{bin_name}`")
+            except (json.JSONDecodeError, KeyError, TypeError):
+                pass
 
-    def add(path: Path, kind: str, reason: str):
-        rel = str(path.relative_to(root))
-        if rel not in seen:
-            seen.add(rel)
-            entries.append({"path": rel, "type": kind, "reason": reason})
-
-    for dirpath, dirnames, filenames in os.walk(root):
-        dirnames[:] = [
-            d for d in dirnames
-            if not _should_skip(d, Path(dirpath) / d)
-        ]
-        for fname in filenames:
-            fpath = Path(dirpath) / fname
-            rel = fpath.relative_to(root)
-
-            # Named entry points
-            if fname in ENTRY_POINT_NAMES:
-                kind = _classify_entry(fname)
-                add(fpath, kind, f"canonical entry-point filename `{fname}`")
-
-            # Python main guard
-            if fname.endswith(".py"):
-                source = _read_safe(fpath)
-                if source and _has_python_main_guard(source):
-                    add(fpath, "python-script", "contains `if __name__ == '__main__'`")
-
-            # package.json main field
-            if fname == "package.json":
-                source = _read_safe(fpath)
-                if source:
-                    try:
-                        data = json.loads(source)
-                        if "main" in data:
-                            main_path = fpath.parent / data["main"]
-                            if main_path.exists():
-                                add(main_path, "node-main", f"referenced as `main` in {rel}")
-                            else:
-                                add(fpath, "node-config", f"`main` field: {data['main']}")
-                        if "bin" in data and isinstance(data["bin"], dict):
-                            for bin_name, bin_path in data["bin"].items():
-                                bp = fpath.parent / bin_path
-                                add(bp if bp.exists() else fpath, "cli-binary", f"npm bin `{bin_name}`")
-                    except (json.JSONDecodeError, KeyError):
-                        pass
-
-    return sorted(entries, key=lambda e: (e["type"], e["path"]))
+    return found
 
 
 def _classify_entry(fname: str) -> str:
@@ -320,98 +823,88 @@ def _classify_entry(fname: str) -> str:
 
 # ── Dependency graph ──────────────────────────────────────────────────────────
 
-def _collect_python_imports(source: str) -> list[str]:
-    """Return list of top-level module names imported in Python source."""
-    modules: list[str] = []
-    try:
-        tree = ast.parse(source)
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Import):
-                for alias in node.names:
-                    modules.append(alias.name.split(".")[0])
-            elif isinstance(node, ast.ImportFrom):
-                if node.module and node.level == 0:
-                    modules.append(node.module.split(".")[0])
-                elif node.level and node.level > 0:
-                    modules.append("." * node.level + (node.module or ""))
-    except SyntaxError:
-        pass
-    return modules
-
-
 def _collect_js_imports(source: str) -> list[str]:
     """Return list of import/require paths from JS/TS source."""
+    if hyperscan is not None:
+        return _collect_js_imports_hs(source)
+    return [m.group(1) or m.group(2) for m in _RE_JS_IMPORT.finditer(source)]
+
+
+# Every _RE_JS_IMPORT match begins with one of these words. With Hyperscan
+# installed, a literal scan finds their offsets and the regex is only tried
+# there, instead of at every position of the source.
+_JS_IMPORT_WORDS = (b"import", b"require")
+_hs_local = threading.local()
+
+
+def _hyperscan_db():
+    # Hyperscan scratch space is not shareable, so each worker thread
+    # compiles its own (tiny) database.
+    db = getattr(_hs_local, "db", None)
+    if db is None:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=list(_JS_IMPORT_WORDS),
+            ids=list(range(len(_JS_IMPORT_WORDS))),
+            elements=len(_JS_IMPORT_WORDS),
+            flags=[0] * len(_JS_IMPORT_WORDS),
+        )
+        _hs_local.db = db
+    return db
+
+
+def _collect_js_imports_hs(source: str) -> list[str]:
+    data = source.encode("utf-8")
+    starts: list[int] = []
+
+    def on_match(word_id, _start, end, _flags, _context):
+        starts.append(end - len(_JS_IMPORT_WORDS[word_id]))
+
+    _hyperscan_db().scan(data, match_event_handler=on_match)
+
+    # Same left-to-right, non-overlapping semantics as finditer()
     modules: list[str] = []
-    patterns = [
-        r'import\s+.*?\s+from\s+["\']([^"\']+)["\']',
-        r'require\s*\(\s*["\']([^"\']+)["\']\s*\)',
-        r'import\s*\(\s*["\']([^"\']+)["\']\s*\)',
-    ]
-    for pat in patterns:
-        for m in re.finditer(pat, source):
-            modules.append(m.group(1))
+    match = _RE_JS_IMPORT_BYTES.match
+    pos = 0
+    for start in sorted(starts):
+        if start < pos:
+            continue
+        m = match(data, start)
+        if m:
+            modules.append((m.group(1) or m.group(2)).decode("utf-8"))
+            pos = m.end()
     return modules
 
 
-def build_dep_graph(root: Path) -> dict[str, dict]:
+def build_dep_graph(root: Path | Iterable[FileInfo]) -> dict[str, dict]:
     """
     Build dependency info for Python and JS/TS files.
     Returns {rel_path: {"local": [...], "external": [...]}}.
     """
-    # Collect all local Python module names (for resolving local vs external)
-    local_py_modules: set[str] = set()
-    for fpath in root.rglob("*.py"):
-        rel = fpath.relative_to(root)
-        parts = rel.parts
-        # Module name is the stem of top-level or package name
-        if len(parts) == 1:
-            local_py_modules.add(fpath.stem)
-        elif len(parts) > 1:
-            local_py_modules.add(parts[0])
+    return _scan_repo(root, deps=True)["graph"]
 
-    graph: dict[str, dict] = {}
 
-    for dirpath, dirnames, filenames in os.walk(root):
-        dirnames[:] = [
-            d for d in dirnames
-            if not _should_skip(d, Path(dirpath) / d)
-        ]
-        for fname in filenames:
-            fpath = Path(dirpath) / fname
-            suffix = fpath.suffix.lower()
-            rel = str(fpath.relative_to(root))
-            source = _read_safe(fpath)
-            if source is None:
-                continue
+def _bucket_imports(
+    imports: list[str], local_modules: AbstractSet[str] = frozenset()
+) -> tuple[set[str], set[str]]:
+    """Split imports into (local, external) sets in a single pass.
 
-            if suffix == ".py":
-                imports = _collect_python_imports(source)
-                local = []
-                external = []
-                for imp in set(imports):
-                    if imp.startswith(".") or imp in local_py_modules:
-                        local.append(imp)
-                    else:
-                        external.append(imp)
-                if local or external:
-                    graph[rel] = {
-                        "local": sorted(local),
-                        "external": sorted(external),
-                    }
-
-            elif suffix in {".js", ".ts", ".jsx", ".tsx", ".mjs", ".cjs"}:
-                imports = _collect_js_imports(source)
-                local = sorted({i for i in imports if i.startswith(".")})
-                external = sorted({i for i in imports if not i.startswith(".")})
-                if local or external:
-                    graph[rel] = {"local": local, "external": external}
-
-    return graph
+    Relative imports are always local; otherwise a name is local when it is
+    one of local_modules. Imports arrive already reduced to their top-level
+    name, so that is a single hash lookup per import.
+    """
+    local: set[str] = set()
+    external: set[str] = set()
+    for imp in imports:
+        if imp.startswith(".") or imp in local_modules:
+            local.add(imp)
+        else:
+            external.add(imp)
+    return local, external
 
 
 def _build_mermaid_graph(graph: dict[str, dict]) -> list[str]:
     """Generate Mermaid flowchart lines from dep graph (Python only, local deps)."""
-    lines = ["```mermaid", "graph TD"]
     node_ids: dict[str, str] = {}
 
     def node_id(path: str) -> str:
@@ -419,195 +912,503 @@ def _build_mermaid_graph(graph: dict[str, dict]) -> list[str]:
             node_ids[path] = f"N{len(node_ids)}"
         return node_ids[path]
 
-    edges: set[tuple[str, str]] = set()
-    for src, deps in graph.items():
-        for local in deps.get("local", []):
-            edges.add((src, local))
+    # Each graph entry's "local" list is already sorted and de-duplicated,
+    # so walking the sources in order yields the edges in sorted order
+    # without collecting them into a set first.
+    edge_lines = []
+    for src in sorted(graph):
+        targets = graph[src].get("local")
+        if not targets:
+            continue
+        src_id = node_id(src)
+        src_label = os.path.splitext(os.path.basename(src))[0]
+        for tgt in targets:
+            tgt_label = tgt.lstrip(".") or tgt
+            edge_lines.append(f'    {src_id}["{src_label}"] --> {node_id(tgt)}["{tgt_label}"]')
 
-    if not edges:
+    if not edge_lines:
         return []
+    return ["```mermaid", "graph TD", *edge_lines, "```"]
 
-    for src, tgt in sorted(edges):
-        src_id = node_id(src)
-        tgt_id = node_id(tgt)
-        src_label = Path(src).stem
-        tgt_label = tgt.lstrip(".") or tgt
-        lines.append(f'    {src_id}["{src_label}"] --> {tgt_id}["{tgt_label}"]')
 
-    lines.append("```")
-    return lines
+# ── Analysis cache ────────────────────────────────────────────────────────────
 
+def _cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "codemap")
 
-# ── Markdown output ───────────────────────────────────────────────────────────
 
-def _count_stats(root: Path) -> dict:
-    counts: dict[str, int] = defaultdict(int)
-    total_files = 0
+class _DiskCache:
+    """Python analyses persisted between runs, keyed by file mtime and size.
+
+    Each scanned root gets its own JSON file in the cache directory, named
+    by a hash of the root, so runs over different roots never load or
+    rewrite each other's entries. save() writes only the files seen in the
+    current run, so deleted files drop out instead of accumulating; cache
+    files of roots not scanned for MAX_AGE_DAYS are deleted on save.
+    """
+
+    VERSION = 3
+    MAX_AGE_DAYS = 30
+    # What _analyze_python() / _sweep_python() return
+    KEYS = frozenset({"docstring", "main_guard", "imports"})
+
+    def __init__(self, root: str, path: Optional[str] = None):
+        self.root = root
+        digest = hashlib.sha1(root.encode("utf-8", "surrogateescape")).hexdigest()[:16]
+        self.path = path or os.path.join(_cache_dir(), f"{digest}.json")
+        self._old: dict = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if (
+                isinstance(data, dict)
+                and data.get("version") == self.VERSION
+                and data.get("root") == root
+                and isinstance(data.get("files"), dict)
+            ):
+                self._old = data["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+        self._new: dict = {}
+        self._dirty = False
+        # [mtime_ns, size] by path, filled from an earlier walk's stat
+        self.stamps: dict[str, list[int]] = {}
+
+    def analyze(self, path: str, source: str, accurate: bool = False) -> dict:
+        """Analyse source, reusing the stored result if path is unchanged.
+
+        accurate is the run's mode (see _RunContext) and part of the stamp,
+        so switching --accurate on or off re-analyses every file once.
+        Entries of an unexpected shape are re-analysed like stale ones.
+        """
+        analyze = _analyze_python if accurate else _sweep_python
+        stamp = self.stamps.get(path)
+        if stamp is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return analyze(source)
+            stamp = [st.st_mtime_ns, st.st_size]
+        stamp = [*stamp, accurate]
+        hit = self._old.get(path)
+        analysis = hit.get("analysis") if isinstance(hit, dict) else None
+        if not (
+            isinstance(analysis, dict)
+            and hit.get("stamp") == stamp
+            and analysis.keys() == self.KEYS
+            and isinstance(analysis["imports"], list)
+        ):
+            analysis = analyze(source)
+            self._dirty = True
+        self._new[path] = {"stamp": stamp, "analysis": analysis}
+        return analysis
+
+    def save(self) -> None:
+        """Atomically write the cache back if anything changed, then prune."""
+        try:
+            if not self._dirty and self._new.keys() == self._old.keys():
+                # Unchanged, but refresh the age so pruning keeps it
+                os.utime(self.path)
+            else:
+                self._write()
+        except OSError:
+            # A read-only or full cache dir must never fail the map itself
+            return
+        self._prune()
+
+    def _write(self) -> None:
+        data = {"version": self.VERSION, "root": self.root, "files": self._new}
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _prune(self) -> None:
+        """Delete this directory's cache files that have gone unused too long."""
+        cutoff = time.time() - self.MAX_AGE_DAYS * 86400
+        try:
+            with os.scandir(os.path.dirname(self.path)) as it:
+                for entry in it:
+                    # analysis.json held every root in one file (VERSION < 3)
+                    if entry.name == "analysis.json" or (
+                        entry.name.endswith(".json") and entry.stat().st_mtime < cutoff
+                    ):
+                        os.unlink(entry.path)
+        except OSError:
+            pass
+
+
+# ── Single-pass scan ──────────────────────────────────────────────────────────
+
+def _default_jobs() -> int:
+    return min(32, (os.cpu_count() or 1) * 4)
+
+
+def _analyze_file(
+    ctx: _RunContext,
+    info: FileInfo,
+    entry_points: bool,
+    describe: bool,
+    deps: bool,
+) -> tuple[list, Optional[str], Optional[list[str]]]:
+    """Run the per-file collectors; safe to call from worker threads.
+
+    Returns (entry_points, description, imports), with imports left as None
+    for files that are not Python or JS/TS source.
+    """
+    fpath, suffix = info.path, info.suffix
+    found = _collect_entry_points(ctx, fpath, info.rel) if entry_points else []
+    desc = None
+    if describe:
+        desc = _describe_stamped(ctx, fpath, suffix, info.mtime_ns, info.size)
+    imports = None
+    if deps and (suffix == ".py" or suffix in JS_EXTENSIONS):
+        source = ctx.read(fpath)
+        if source is not None:
+            if suffix == ".py":
+                imports = ctx.python_analysis(fpath, source)["imports"]
+            else:
+                imports = _collect_js_imports(source)
+    return found, desc, imports
+
+
+def _scan_repo(
+    root: Path | Iterable[FileInfo],
+    max_files: int = 200,
+    stats: bool = False,
+    entry_points: bool = False,
+    descriptions: bool = False,
+    deps: bool = False,
+    jobs: Optional[int] = None,
+    disk_cache: Optional[_DiskCache] = None,
+    accurate: bool = False,
+) -> dict:
+    """Walk root once, feeding every kept file to the requested collectors.
+
+    root may also be a _scan_project() list, which is used as is. The walk
+    itself is a cheap scandir pass; the per-file reads and parses
+    then run on a pool of `jobs` threads (1 runs them inline) while results
+    are merged on the calling thread. Python analyses are read from and
+    recorded in disk_cache when one is given, and use the AST instead of
+    the regex sweep when accurate is set. Returns a dict holding whichever of
+    "stats", "entry_points", "descriptions" and "graph" were asked for.
+    """
     total_dirs = 0
-    for dirpath, dirnames, filenames in os.walk(root):
-        dirnames[:] = [
-            d for d in dirnames
-            if not _should_skip(d, Path(dirpath) / d)
-        ]
-        total_dirs += len(dirnames)
-        for fname in filenames:
-            fpath = Path(dirpath) / fname
-            if not _should_skip(fname, fpath):
-                counts[fpath.suffix.lower() or "(no ext)"] += 1
-                total_files += 1
-
-    top_exts = sorted(counts.items(), key=lambda x: -x[1])[:8]
-    return {
-        "total_files": total_files,
-        "total_dirs": total_dirs,
-        "top_extensions": top_exts,
-    }
+    files: list[FileInfo] = []
+    py_module_names: set[str] = set()
+
+    for info in _walk_infos(root):
+        if info.is_dir:
+            total_dirs += 1
+            continue
+        files.append(info)
+        if info.suffix == ".py":
+            # Module name is the stem of top-level or package name
+            top, sep, _ = info.rel.partition(os.sep)
+            py_module_names.add(top if sep else top[:-3])
+    # Frozen once the walk is done; every Python file's imports are
+    # bucketed against it
+    local_py_modules = frozenset(py_module_names)
+
+    eps: list[dict] = []
+    seen: set[str] = set()
+    descs: dict[str, str] = {}
+    graph: dict[str, dict] = {}
 
+    if entry_points or descriptions or deps:
+        ctx = _RunContext(disk_cache, accurate)
 
-def generate_map(
-    directory: str,
-    output: Optional[str] = None,
-    max_depth: int = 6,
-    max_files: int = 300,
-    mermaid: bool = False,
-    no_deps: bool = False,
-) -> str:
-    """Generate the full codebase map and return as markdown string."""
-    root = Path(directory).resolve()
-    if not root.exists():
-        raise FileNotFoundError(f"Directory not found: {directory}")
-    if not root.is_dir():
+        def task(index: int):
+            return _analyze_file(
+                ctx, files[index], entry_points, descriptions and index < max_files, deps,
+            )
+
+        if disk_cache is not None:
+            # Stamp from the walk's stat instead of stat-ing each file again
+            disk_cache.stamps.update(
+                (info.path, [info.mtime_ns, info.size]) for info in files if info.suffix == ".py"
+            )
+        # Never more workers than files; a lone file is analysed inline
+        jobs = min(jobs or _default_jobs(), len(files))
+        if jobs <= 1:
+            results = list(map(task, range(len(files))))
+        else:
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(task, range(len(files))))
+
+        for info, (found, desc, imports) in zip(files, results):
+            rel = info.rel
+            for ep_rel, kind, reason in found:
+                if ep_rel not in seen:
+                    seen.add(ep_rel)
+                    eps.append({"path": ep_rel, "type": kind, "reason": reason})
+            if desc:
+                descs[rel] = desc
+            if not imports:
+                continue
+            if info.suffix == ".py":
+                local, external = _bucket_imports(imports, local_py_modules)
+            else:
+                local, external = _bucket_imports(imports)
+            graph[rel] = {"local": sorted(local), "external": sorted(external)}
+
+    result: dict = {}
+    if stats:
+        # Counter tallies the whole iterable in C; ties keep first-seen order
+        counts = Counter([info.suffix or "(no ext)" for info in files])
+        top_exts = counts.most_common(8)
+        result["stats"] = {
+            "total_files": len(files),
+            "total_dirs": total_dirs,
+            "top_extensions": top_exts,
+        }
+    if entry_points:
+        result["entry_points"] = sorted(eps, key=lambda e: (e["type"], e["path"]))
+    if descriptions:
+        result["descriptions"] = descs
+    if deps:
+        result["graph"] = graph
+    return result
+
+
+# ── Markdown output ───────────────────────────────────────────────────────────
+
+def _count_stats(root: Path | Iterable[FileInfo]) -> dict:
+    return _scan_repo(root, stats=True)["stats"]
+
+
+def _resolve_root(directory: str) -> str:
+    # abspath() only joins onto the cwd and normalizes; unlike resolve() it
+    # runs no per-component readlink, and a symlinked checkout keeps the
+    # name it was given. Every path below root is built by scandir.
+    root = os.path.abspath(directory)
+    try:
+        st = os.stat(root)
+    except (FileNotFoundError, NotADirectoryError):
+        # Other errors (EACCES, ELOOP, ...) propagate with their own message
+        raise FileNotFoundError(f"Directory not found: {directory}") from None
+    if not stat.S_ISDIR(st.st_mode):
         raise NotADirectoryError(f"Not a directory: {directory}")
+    return root
 
-    project_name = root.name
-    lines: list[str] = []
 
-    # Header
-    lines.append(f"# Codebase Map: `{project_name}`")
-    lines.append("")
-    lines.append(f"> Generated by codemap.py | Path: `{root}`")
-    lines.append("")
-
-    # Overview / stats
-    lines.append("## Overview")
-    lines.append("")
-    stats = _count_stats(root)
-    lines.append(f"- **Files**: {stats['total_files']}")
-    lines.append(f"- **Directories**: {stats['total_dirs']}")
+def _overview_lines(files: list[FileInfo], stats: dict) -> Iterator[str]:
+    yield "## Overview"
+    yield ""
+    yield f"- **Files**: {stats['total_files']}"
+    yield f"- **Directories**: {stats['total_dirs']}"
     if stats["top_extensions"]:
         ext_str = ", ".join(f"`{e}` ({n})" for e, n in stats["top_extensions"])
-        lines.append(f"- **Top file types**: {ext_str}")
-    lines.append("")
-
-    # README snippet
-    readme_path = None
-    for name in ("README.md", "README.rst", "README.txt", "README"):
-        candidate = root / name
-        if candidate.exists():
-            readme_path = candidate
-            break
+        yield f"- **Top file types**: {ext_str}"
+    yield ""
+
+    # README snippet, already read by the walk
+    readmes = {info.rel: info.head for info in files if info.head is not None}
+    content = next((readmes[name] for name in README_NAMES if name in readmes), None)
 
-    if readme_path:
-        lines.append("### README Excerpt")
-        lines.append("")
-        content = _read_safe(readme_path, max_bytes=1200) or ""
+    if content is not None:
+        yield "### README Excerpt"
+        yield ""
         excerpt = "\n".join(content.splitlines()[:20])
-        lines.append("```")
-        lines.append(excerpt.strip())
-        lines.append("```")
-        lines.append("")
-
-    # File tree
-    lines.append("## File Tree")
-    lines.append("")
-    lines.append(f"```")
-    lines.append(project_name + "/")
-    tree_lines = build_file_tree(root, max_depth=max_depth, max_files=max_files)
-    lines.extend(tree_lines)
-    lines.append("```")
-    lines.append("")
-
-    # Entry points
-    lines.append("## Entry Points")
-    lines.append("")
-    entry_points = find_entry_points(root)
+        yield "```"
+        yield excerpt.strip()
+        yield "```"
+        yield ""
+
+
+def _tree_lines(
+    project_name: str, files: list[FileInfo], max_depth: int, max_files: int
+) -> Iterator[str]:
+    yield "## File Tree"
+    yield ""
+    yield "```"
+    yield project_name + "/"
+    yield from build_file_tree(files, max_depth=max_depth, max_files=max_files)
+    yield "```"
+    yield ""
+
+
+def _entry_point_lines(entry_points: list[dict]) -> Iterator[str]:
+    yield "## Entry Points"
+    yield ""
     if entry_points:
         for ep in entry_points:
-            lines.append(f"- **`{ep['path']}`** `[{ep['type']}]` - {ep['reason']}")
+            yield f"- **`{ep['path']}`** `[{ep['type']}]` - {ep['reason']}"
     else:
-        lines.append("_No entry points detected._")
-    lines.append("")
+        yield "_No entry points detected._"
+    yield ""
+
+
+def _description_lines(descriptions: dict[str, str], project_name: str) -> Iterator[str]:
+    yield "## Module Descriptions"
+    yield ""
+    if not descriptions:
+        yield "_No module descriptions found._"
+        yield ""
+        return
+
+    # Group by directory
+    by_dir: dict[str, list[tuple[str, str]]] = defaultdict(list)
+    for rel, desc in sorted(descriptions.items()):
+        parent = os.path.dirname(rel) or "."
+        by_dir[parent].append((rel, desc))
+
+    for parent in sorted(by_dir.keys()):
+        dir_label = parent if parent != "." else project_name + "/"
+        yield f"### `{dir_label}`"
+        yield ""
+        for rel, desc in by_dir[parent]:
+            fname = os.path.basename(rel)
+            yield f"- **`{fname}`** - {desc}"
+        yield ""
+
+
+def _dependency_lines(graph: dict[str, dict], mermaid: bool) -> Iterator[str]:
+    yield "## Dependency Graph"
+    yield ""
+    if not graph:
+        yield "_No dependency information extracted._"
+        yield ""
+        return
+
+    # External dependencies summary
+    all_external: Counter[str] = Counter()
+    for deps in graph.values():
+        all_external.update(deps.get("external", ()))
+
+    if all_external:
+        yield "### External Dependencies"
+        yield ""
+        top = all_external.most_common(20)
+        for pkg, count in top:
+            yield f"- `{pkg}` (imported in {count} file{'s' if count > 1 else ''})"
+        yield ""
+
+    # Local dependency map
+    yield "### Local Module Dependencies"
+    yield ""
+    has_local = False
+    for rel in sorted(graph.keys()):
+        local = graph[rel].get("local", [])
+        if local:
+            has_local = True
+            deps_str = ", ".join(f"`{d}`" for d in local)
+            yield f"- **`{rel}`** imports: {deps_str}"
+    if not has_local:
+        yield "_No local dependencies detected._"
+    yield ""
+
+    # Mermaid diagram (optional)
+    if mermaid:
+        mermaid_lines = _build_mermaid_graph(graph)
+        if mermaid_lines:
+            yield "### Dependency Diagram (Mermaid)"
+            yield ""
+            yield from mermaid_lines
+            yield ""
+
+
+def _map_lines(
+    root: str,
+    max_depth: int = 6,
+    max_files: int = 300,
+    mermaid: bool = False,
+    no_deps: bool = False,
+    jobs: Optional[int] = None,
+    use_cache: bool = False,
+    accurate: bool = False,
+) -> Iterator[str]:
+    """Yield the markdown map of root line by line, without trailing newlines."""
+    disk_cache = _DiskCache(root) if use_cache else None
+    # One walk feeds the tree and every collector
+    files = _scan_project(root)
+    scan = _scan_repo(
+        files,
+        max_files=max_files,
+        stats=True,
+        entry_points=True,
+        descriptions=True,
+        deps=not no_deps,
+        jobs=jobs,
+        disk_cache=disk_cache,
+        accurate=accurate,
+    )
+    if disk_cache is not None:
+        disk_cache.save()
+
+    project_name = os.path.basename(root)
+    yield f"# Codebase Map: `{project_name}`"
+    yield ""
+    yield f"> Generated by codemap.py | Path: `{root}`"
+    yield ""
+    yield from _overview_lines(files, scan["stats"])
+    yield from _tree_lines(project_name, files, max_depth, max_files)
+    yield from _entry_point_lines(scan["entry_points"])
+    yield from _description_lines(scan["descriptions"], project_name)
+    if not no_deps:
+        yield from _dependency_lines(scan["graph"], mermaid)
 
-    # Module descriptions
-    lines.append("## Module Descriptions")
-    lines.append("")
-    descriptions = collect_module_descriptions(root, max_files=max_files)
-    if descriptions:
-        # Group by directory
-        by_dir: dict[str, list[tuple[str, str]]] = defaultdict(list)
-        for rel, desc in sorted(descriptions.items()):
-            parent = str(Path(rel).parent)
-            by_dir[parent].append((rel, desc))
-
-        for parent in sorted(by_dir.keys()):
-            dir_label = parent if parent != "." else project_name + "/"
-            lines.append(f"### `{dir_label}`")
-            lines.append("")
-            for rel, desc in by_dir[parent]:
-                fname = Path(rel).name
-                lines.append(f"- **`{fname}`** - {desc}")
-            lines.append("")
-    else:
-        lines.append("_No module descriptions found._")
-        lines.append("")
 
-    # Dependency graph
-    if not no_deps:
-        lines.append("## Dependency Graph")
-        lines.append("")
-        graph = build_dep_graph(root)
-        if graph:
-            # External dependencies summary
-            all_external: dict[str, int] = defaultdict(int)
-            for deps in graph.values():
-                for ext in deps.get("external", []):
-                    all_external[ext] += 1
-
-            if all_external:
-                lines.append("### External Dependencies")
-                lines.append("")
-                top = sorted(all_external.items(), key=lambda x: -x[1])[:20]
-                for pkg, count in top:
-                    lines.append(f"- `{pkg}` (imported in {count} file{'s' if count > 1 else ''})")
-                lines.append("")
-
-            # Local dependency map
-            lines.append("### Local Module Dependencies")
-            lines.append("")
-            has_local = False
-            for rel in sorted(graph.keys()):
-                local = graph[rel].get("local", [])
-                if local:
-                    has_local = True
-                    deps_str = ", ".join(f"`{d}`" for d in local)
-                    lines.append(f"- **`{rel}`** imports: {deps_str}")
-            if not has_local:
-                lines.append("_No local dependencies detected._")
-            lines.append("")
-
-            # Mermaid diagram (optional)
-            if mermaid:
-                mermaid_lines = _build_mermaid_graph(graph)
-                if mermaid_lines:
-                    lines.append("### Dependency Diagram (Mermaid)")
-                    lines.append("")
-                    lines.extend(mermaid_lines)
-                    lines.append("")
-        else:
-            lines.append("_No dependency information extracted._")
-            lines.append("")
+def _emit_map(out: TextIO, lines: Iterable[str]) -> None:
+    """Stream map lines (from _map_lines()) into out, one section at a time.
+
+    Lines are newline-separated exactly as "\n".join() would produce, so
+    the streamed text matches generate_map()'s return value.
+    """
+    write = out.write
+    sep = ""
+    for line in lines:
+        write(sep)
+        write(line)
+        sep = "\n"
 
-    result = "\n".join(lines)
+
+def generate_map(
+    directory: str,
+    output: Optional[str] = None,
+    max_depth: int = 6,
+    max_files: int = 300,
+    mermaid: bool = False,
+    no_deps: bool = False,
+    jobs: Optional[int] = None,
+    use_cache: bool = False,
+    accurate: bool = False,
+    out: Optional[TextIO] = None,
+) -> Optional[str]:
+    """Generate the full codebase map and return as markdown string.
+
+    When out is given, the map is streamed into it section by section
+    instead of being built in memory, and None is returned. out and output
+    are alternatives; passing both raises ValueError.
+    """
+    if out is not None and output:
+        raise ValueError("pass either output or out, not both")
+    root = _resolve_root(directory)
+    options = dict(
+        max_depth=max_depth,
+        max_files=max_files,
+        mermaid=mermaid,
+        no_deps=no_deps,
+        jobs=jobs,
+        use_cache=use_cache,
+        accurate=accurate,
+    )
+    if out is not None:
+        _emit_map(out, _map_lines(root, **options))
+        return None
+
+    # Everything is returned anyway, so build the text with a single join
+    # rather than streaming it through _emit_map() into a buffer.
+    result = "\n".join(_map_lines(root, **options))
 
     if output:
         out_path = Path(output)
@@ -670,18 +1471,55 @@ Examples:
         action="store_true",
         help="Skip dependency graph analysis",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the on-disk analysis cache",
+    )
+    parser.add_argument(
+        "--accurate",
+        action="store_true",
+        help="Parse Python files with ast instead of the faster regex import sweep",
+    )
+    parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Worker threads for per-file analysis (default: auto; 1 disables threading)",
+    )
 
     args = parser.parse_args()
-
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    options = dict(
+        max_depth=args.max_depth,
+        max_files=args.max_files,
+        mermaid=args.mermaid,
+        no_deps=args.no_deps,
+        jobs=args.jobs,
+        use_cache=not args.no_cache,
+        accurate=args.accurate,
+    )
     try:
-        result = generate_map(
-            directory=args.directory,
-            output=args.output,
-            max_depth=args.max_depth,
-            max_files=args.max_files,
-            mermaid=args.mermaid,
-            no_deps=args.no_deps,
-        )
+        root = _resolve_root(args.directory)
+        lines = _map_lines(root, **options)
+        if args.output:
+            # The scan runs on the first line; finish it before the output
+            # file is created or truncated, so a failed run keeps the old
+            # map and a new file is not listed in its own tree
+            first = next(lines)
+            out_path = Path(args.output)
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            # A large buffer keeps the many small section writes to a
+            # handful of write() syscalls
+            with open(out_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+                _emit_map(f, chain((first,), lines))
+        else:
+            _emit_map(sys.stdout, lines)
+            sys.stdout.write("\n")
+            sys.stdout.flush()
     except FileNotFoundError as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
@@ -691,14 +1529,17 @@ Examples:
     except PermissionError as e:
         print(f"Error: permission denied - {e}", file=sys.stderr)
         sys.exit(1)
+    except BrokenPipeError:
+        # Reader went away (e.g. `codemap . | head`); point stdout at
+        # devnull so the interpreter's final flush does not raise again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
     except KeyboardInterrupt:
         print("\nAborted.", file=sys.stderr)
         sys.exit(130)
 
     if args.output:
         print(f"Map written to: {args.output}", file=sys.stderr)
-    else:
-        print(result)
 
 
 if __name__ == "__main__":
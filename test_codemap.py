@@ -1,10 +1,12 @@
 """Tests for codemap.py - codebase map generator."""
 
+import io
 import json
 import subprocess
 import sys
 import textwrap
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pytest
@@ -14,6 +16,12 @@ import codemap
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path_factory, monkeypatch):
+    """Keep disk-cache writes (including CLI subprocesses) out of ~/.cache."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path_factory.mktemp("xdg-cache")))
+
+
 def make_project(tmp_path: Path, structure: dict) -> Path:
     """Create a mock project from a nested dict.
 
@@ -117,6 +125,114 @@ def test_file_tree_depth_limit(tmp_path):
     assert "max depth" in flat.lower()
 
 
+def test_file_tree_does_not_follow_symlinked_dirs(tmp_path):
+    make_project(tmp_path, {"pkg": {"mod.py": "pass"}})
+    (tmp_path / "pkg" / "loop").symlink_to(tmp_path, target_is_directory=True)
+    lines = codemap.build_file_tree(tmp_path)
+    flat = "\n".join(lines)
+    assert "loop" in flat
+    assert flat.count("mod.py") == 1
+
+
+def test_file_tree_marks_unreadable_dirs(tmp_path, monkeypatch):
+    make_project(tmp_path, {"locked": {"secret.py": "pass"}, "main.py": "pass"})
+    real_scandir = codemap.os.scandir
+
+    def scandir(path):
+        if str(path).rstrip("/\\").endswith("locked"):
+            raise PermissionError(13, "Permission denied", str(path))
+        return real_scandir(path)
+
+    monkeypatch.setattr(codemap.os, "scandir", scandir)
+    expected = ["├── locked", "│   [permission denied]", "└── main.py"]
+    assert codemap.build_file_tree(tmp_path) == expected
+    assert codemap.build_file_tree(codemap._scan_project(tmp_path)) == expected
+
+
+def test_file_tree_max_files_truncates(tmp_path):
+    make_project(tmp_path, {
+        "a": {"one.py": "", "two.py": ""},
+        "z.py": "",
+    })
+    lines = codemap.build_file_tree(tmp_path, max_files=2)
+    assert lines == [
+        "├── a",
+        "│   ├── one.py",
+        "│   ... (1 more items truncated)",
+        "... (1 more items truncated)",
+    ]
+
+
+def test_file_tree_deep_nesting(tmp_path):
+    deep = tmp_path
+    for _ in range(60):
+        deep = deep / "d"
+    deep.mkdir(parents=True)
+    lines = codemap.build_file_tree(tmp_path, max_depth=100, max_files=1000)
+    assert len(lines) == 60
+
+
+# ── Walker tests ──────────────────────────────────────────────────────────────
+
+def test_scanwalk_prunes_and_yields_rel_paths(tmp_path):
+    make_project(tmp_path, {
+        "app.py": "pass",
+        "bundle.min.js": "x",
+        "LOGO.PNG": "x",
+        ".hidden": {"secret.py": "pass"},
+        "node_modules": {"dep.js": "x"},
+        "pkg": {"mod.py": "pass"},
+    })
+    rels = [rel for _, rel, _ in codemap._scanwalk(tmp_path)]
+    assert rels == ["app.py", "pkg", str(Path("pkg") / "mod.py")]
+
+
+def test_codemapignore_prunes_walk_and_tree(tmp_path):
+    make_project(tmp_path, {
+        ".codemapignore": "# generated\n*.log\ndocs/build/\nfixtures\n",
+        "app.py": "pass",
+        "debug.log": "x",
+        "docs": {"build": {"index.html": "x"}, "intro.md": "x"},
+        "tests": {"fixtures": {"big.py": "pass"}, "test_app.py": "pass"},
+    })
+    rels = [rel for _, rel, _ in codemap._scanwalk(tmp_path)]
+    assert str(Path("docs") / "intro.md") in rels
+    assert not any(r.endswith(("debug.log", "build", "fixtures", "big.py")) for r in rels)
+    flat = "\n".join(codemap.build_file_tree(tmp_path))
+    assert "debug.log" not in flat and "fixtures" not in flat and "intro.md" in flat
+
+
+def test_scan_repo_single_pass_matches_collectors(tmp_path):
+    make_project(tmp_path, {
+        "main.py": '"""Entry."""\nimport utils\nif __name__ == "__main__": pass\n',
+        "utils.py": '"""Helpers."""\nimport os\n',
+        "web": {"app.js": "const x = require('./lib');\n"},
+    })
+    scan = codemap._scan_repo(
+        tmp_path, stats=True, entry_points=True, descriptions=True, deps=True,
+    )
+    assert scan["stats"] == codemap._count_stats(tmp_path)
+    assert scan["entry_points"] == codemap.find_entry_points(tmp_path)
+    assert scan["descriptions"] == codemap.collect_module_descriptions(tmp_path)
+    assert scan["graph"] == codemap.build_dep_graph(tmp_path)
+    assert set(codemap._scan_repo(tmp_path, stats=True)) == {"stats"}
+
+
+def test_scan_project_list_feeds_every_collector(tmp_path):
+    make_project(tmp_path, {
+        "main.py": '"""Entry."""\nimport utils\n',
+        "utils.py": "import os\n",
+        "pkg": {"sub": {"deep.py": "pass"}, "mod.py": "pass"},
+    })
+    files = codemap._scan_project(tmp_path)
+    assert [f.rel for f in files if f.is_dir] == ["pkg", str(Path("pkg") / "sub")]
+    assert codemap.build_file_tree(files, max_depth=1) == codemap.build_file_tree(
+        tmp_path, max_depth=1
+    )
+    assert codemap.build_dep_graph(files) == codemap.build_dep_graph(tmp_path)
+    assert codemap._count_stats(files) == codemap._count_stats(tmp_path)
+
+
 # ── Docstring / description tests ─────────────────────────────────────────────
 
 def test_extract_python_docstring_clean():
@@ -135,6 +251,139 @@ def test_extract_python_docstring_regex_fallback():
     assert "My module" in result
 
 
+def test_docstring_fallback_skips_bom_comments_and_prefix():
+    source = '\ufeff#!/usr/bin/env python\n# -*- coding: utf-8 -*-\n\nr"""Raw doc."""\nx = ('
+    assert codemap._docstring_fallback(source) == "Raw doc."
+    assert codemap._docstring_fallback('"""Never closed') is None
+    assert codemap._docstring_fallback("x = 1\n'''Not first.'''") is None
+
+
+def test_single_quoted_docstrings_are_described(tmp_path):
+    make_project(tmp_path, {
+        "single.py": "'Single-quoted module docstring.'\nimport os\n",
+        "double.py": '"One-liner."  # note\n',
+    })
+    assert codemap.describe_file(tmp_path / "single.py") == "Single-quoted module docstring."
+    assert codemap.describe_file(tmp_path / "double.py") == "One-liner."
+    assert codemap._docstring_fallback('"-".join(parts)\n') is None
+    assert codemap._docstring_fallback('"Never closed\n"') is None
+
+
+def test_analyze_python_single_pass():
+    source = textwrap.dedent("""
+        \"\"\"Runs the tool.\"\"\"
+        import os.path
+        from . import sibling
+        from pkg.sub import thing
+
+        if __name__ == "__main__":
+            pass
+    """)
+    analysis = codemap._analyze_python(source)
+    assert analysis["docstring"] == "Runs the tool."
+    assert analysis["main_guard"] is True
+    assert analysis["imports"] == ["os", ".", "pkg"]
+
+
+def test_analyze_python_only_visits_module_level():
+    source = textwrap.dedent("""
+        try:
+            import ujson
+        except ImportError:
+            import json
+        if True:
+            import typing
+
+        def lazy():
+            import hidden
+    """)
+    assert sorted(codemap._analyze_python(source)["imports"]) == ["json", "typing", "ujson"]
+
+
+def test_analyze_python_skips_parse_for_blank_source(monkeypatch):
+    def boom(source):
+        raise AssertionError("ast.parse should not run")
+    monkeypatch.setattr(codemap.ast, "parse", boom)
+    assert codemap._analyze_python("\n  \n") == {
+        "docstring": None, "main_guard": False, "imports": [],
+    }
+
+
+def test_sweep_python_matches_ast_for_module_imports():
+    source = (
+        '"""Sweep me."""\n'
+        "import os, sys as system\n"
+        "import xml.etree.ElementTree as ET\n"
+        "from collections import abc\n"
+        "from . import sibling\n"
+        "from ..pkg.mod import thing\n"
+        "try:\n"
+        "    import ujson as json\n"
+        "except ImportError:\n"
+        "    import json\n"
+        "if __name__ == '__main__':\n"
+        "    pass\n"
+    )
+    assert codemap._sweep_python(source) == codemap._analyze_python(source)
+
+
+def test_sweep_python_ignores_dotted_prose():
+    source = '"""Helpers.\n\nimport ... as needed, or import .x\n"""\nimport os\n'
+    assert codemap._sweep_python(source)["imports"] == ["os"]
+
+
+def test_sweep_python_handles_comment_only_file():
+    assert codemap._sweep_python("# just a comment")["docstring"] is None
+
+
+def test_generate_map_accurate_skips_function_imports(tmp_path):
+    make_project(tmp_path, {
+        "app.py": "import os\n\ndef load():\n    import yaml\n",
+    })
+    assert "`yaml`" in codemap.generate_map(str(tmp_path))
+    assert "`yaml`" not in codemap.generate_map(str(tmp_path), accurate=True)
+
+
+def test_concurrent_maps_keep_their_own_mode(tmp_path):
+    make_project(tmp_path, {
+        f"mod{i}.py": "import os\n\ndef load():\n    import yaml\n" for i in range(100)
+    })
+    fast = codemap.generate_map(str(tmp_path))
+    accurate = codemap.generate_map(str(tmp_path), accurate=True)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        for _ in range(3):
+            a = pool.submit(codemap.generate_map, str(tmp_path), accurate=True)
+            f = pool.submit(codemap.generate_map, str(tmp_path))
+            assert (a.result(), f.result()) == (accurate, fast)
+
+
+def test_analyze_python_parses_import_prefix_of_truncated_head():
+    source = (
+        '"""Big module."""\n'
+        "import os\n"
+        "from typing import (\n"
+        "    Any,\n"
+        ")\n"
+        "\n"
+        "def cut_off(\n"
+    )
+    assert codemap._import_prefix(source).endswith(")\n\n")
+    analysis = codemap._analyze_python(source)
+    assert analysis["docstring"] == "Big module."
+    assert analysis["imports"] == ["os", "typing"]
+
+
+def test_import_prefix_keeps_one_line_compound_imports():
+    source = "import os\nx = 1\ntry: import ujson\nexcept ImportError: ujson = None\n"
+    assert codemap._import_prefix(source) is None
+    assert codemap._analyze_python(source)["imports"] == ["os", "ujson"]
+
+
+def test_analyze_python_syntax_error_uses_fallback():
+    analysis = codemap._analyze_python('"""Partial."""\ndef broken(')
+    assert analysis == {"docstring": "Partial.", "main_guard": False, "imports": []}
+
+
 def test_describe_file_python_docstring(tmp_path):
     f = tmp_path / "mymod.py"
     f.write_text('"""Handles user authentication."""\nimport os\n')
@@ -164,15 +413,74 @@ def test_describe_file_package_json(tmp_path):
     assert "A cool app" in desc
 
 
+def test_describe_file_large_package_json(tmp_path):
+    f = tmp_path / "package.json"
+    deps = {f"dep-{i}": "^1.0.0" for i in range(1000)}
+    f.write_text(json.dumps({"name": "big-app", "dependencies": deps}))
+    assert f.stat().st_size > codemap._SOURCE_BYTES
+    assert codemap.describe_file(f) == "big-app"
+
+
+def test_describe_file_memoized_until_file_changes(tmp_path, monkeypatch):
+    f = tmp_path / "notes.sh"
+    f.write_text("# First version\n")
+    reads = []
+    real = codemap._read_safe
+    monkeypatch.setattr(
+        codemap, "_read_safe", lambda p, n: reads.append(p) or real(p, n)
+    )
+    assert codemap.describe_file(f) == "First version"
+    assert codemap.describe_file(f) == "First version"
+    assert len(reads) == 1
+
+    f.write_text("# Second, longer version\n")
+    assert codemap.describe_file(f) == "Second, longer version"
+    codemap.clear_cache()
+    assert codemap.describe_file(f) == "Second, longer version"
+    assert len(reads) == 3
+
+
 def test_describe_file_binary(tmp_path):
     f = tmp_path / "image.png"
     f.write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00\x00")
     # PNG files are in SKIP_EXTENSIONS so describe_file won't see them normally
-    # but if called directly, binary bytes cause UnicodeDecodeError
+    # but if called directly, the extension alone marks them binary
     desc = codemap.describe_file(f)
     assert desc == "[binary or unreadable]"
 
 
+def test_describe_file_binary_extension_skips_read(tmp_path, monkeypatch):
+    f = tmp_path / "font.woff2"
+    f.write_bytes(b"wOF2" + bytes(range(1, 200)))
+    monkeypatch.setattr(codemap, "_read_safe", lambda p, n: pytest.fail("read"))
+    assert codemap.describe_file(f) == "[binary or unreadable]"
+
+
+def test_scan_reads_each_file_once(tmp_path, monkeypatch):
+    make_project(tmp_path, {
+        "tool.py": '"""Tool."""\nimport os\nif __name__ == "__main__": pass\n',
+    })
+    reads = []
+    real = codemap._read_safe
+    monkeypatch.setattr(
+        codemap, "_read_safe", lambda p, n: reads.append(p) or real(p, n)
+    )
+    codemap._scan_repo(tmp_path, entry_points=True, descriptions=True, deps=True)
+    assert len(reads) == 1
+
+
+def test_read_safe_tolerates_split_multibyte_char(tmp_path):
+    f = tmp_path / "notes.txt"
+    f.write_text("é" * 10, encoding="utf-8")  # 20 bytes
+    assert codemap._read_safe(f, max_bytes=5) == "éé"
+
+
+def test_describe_file_nul_bytes_are_binary(tmp_path):
+    f = tmp_path / "blob"
+    f.write_bytes(b"ELF\x00\x00plain ascii otherwise")
+    assert codemap.describe_file(f) == "[binary or unreadable]"
+
+
 # ── Entry points tests ────────────────────────────────────────────────────────
 
 def test_find_entry_points_main_py(tmp_path):
@@ -219,6 +527,18 @@ def test_find_entry_points_package_json_bin(tmp_path):
     assert "cli-binary" in types or "node-config" in types
 
 
+def test_find_entry_points_nested_package_json_main(tmp_path):
+    make_project(tmp_path, {
+        "web": {
+            "package.json": json.dumps({"name": "web", "main": "./server.js"}),
+            "server.js": "// Web server",
+        },
+    })
+    eps = codemap.find_entry_points(tmp_path)
+    mains = [e["path"] for e in eps if e["type"] == "node-main"]
+    assert mains == [str(Path("web") / "server.js")]
+
+
 # ── Dependency graph tests ────────────────────────────────────────────────────
 
 def test_build_dep_graph_python(tmp_path):
@@ -252,6 +572,32 @@ def test_build_dep_graph_js(tmp_path):
     assert "express" in graph["app.js"]["external"]
 
 
+def test_collect_js_imports_all_forms():
+    source = textwrap.dedent("""
+        import React from 'react';
+        const fs = require("fs");
+        const lazy = import('./lazy');
+        const dyn = require("x" + suffix);
+    """)
+    assert codemap._collect_js_imports(source) == ["react", "fs", "./lazy"]
+
+
+@pytest.mark.parametrize("source", [
+    textwrap.dedent("""
+        import a from './a'; import b from "./b";
+        const c = require('c'); requirements(); important("x");
+        import './side-effect.css';
+        export default () => import("./lazy");
+    """),
+    "import\u00a0b from './b'\n" * 50 + "import a from './a'\n",
+])
+def test_collect_js_imports_hyperscan_matches_re(monkeypatch, source):
+    pytest.importorskip("hyperscan")
+    fast = codemap._collect_js_imports(source)
+    monkeypatch.setattr(codemap, "hyperscan", None)
+    assert fast == codemap._collect_js_imports(source)
+
+
 def test_build_dep_graph_empty_dir(tmp_path):
     """Empty dir produces empty graph."""
     graph = codemap.build_dep_graph(tmp_path)
@@ -310,6 +656,86 @@ def test_generate_map_mermaid(tmp_path):
     assert "mermaid" in result
 
 
+def test_generate_map_disk_cache_skips_reparse(tmp_path, monkeypatch):
+    project = make_project(tmp_path / "proj", {
+        "app.py": '"""App module."""\nimport utils\n',
+        "utils.py": "import os\n",
+    })
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    first = codemap.generate_map(str(project), use_cache=True)
+    assert len(list((tmp_path / "cache" / "codemap").glob("*.json"))) == 1
+
+    parsed = []
+    real = codemap._sweep_python
+    monkeypatch.setattr(
+        codemap, "_sweep_python", lambda src: parsed.append(src) or real(src)
+    )
+    assert codemap.generate_map(str(project), use_cache=True) == first
+    assert parsed == []
+
+    (project / "utils.py").write_text("import os\nimport json\n")
+    assert "`json`" in codemap.generate_map(str(project), use_cache=True)
+    assert len(parsed) == 1
+
+
+@pytest.mark.parametrize("files", [[], {"app.py": "x"}, {"app.py": {"analysis": 5}}])
+def test_disk_cache_bad_shape_is_a_miss(tmp_path, files):
+    project = make_project(tmp_path / "proj", {"app.py": "import requests\n"})
+    if isinstance(files, dict):
+        files = {str(project / k): v for k, v in files.items()}
+    cache = codemap._DiskCache(str(project))
+    Path(cache.path).parent.mkdir(parents=True, exist_ok=True)
+    Path(cache.path).write_text(json.dumps(
+        {"version": cache.VERSION, "root": str(project), "files": files}
+    ))
+    assert "`requests`" in codemap.generate_map(str(project), use_cache=True)
+
+
+def test_disk_cache_follows_the_run_mode(tmp_path):
+    project = make_project(tmp_path, {"app.py": "def load():\n    import yaml\n"})
+    disk = codemap._DiskCache(str(project))
+    scan = codemap._scan_repo(project, deps=True, disk_cache=disk, accurate=True)
+    assert "app.py" not in scan["graph"]
+    scan = codemap._scan_repo(project, deps=True, disk_cache=disk)
+    assert scan["graph"]["app.py"]["external"] == ["yaml"]
+
+
+def test_disk_cache_keeps_roots_apart_and_prunes_stale(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    cache_dir = tmp_path / "cache" / "codemap"
+    cache_dir.mkdir(parents=True)
+    (cache_dir / "analysis.json").write_text("{}")
+    stale = cache_dir / "0123456789abcdef.json"
+    stale.write_text("{}")
+    old = codemap.time.time() - (codemap._DiskCache.MAX_AGE_DAYS + 1) * 86400
+    codemap.os.utime(stale, (old, old))
+
+    roots = [
+        make_project(tmp_path / name, {f"m{i}.py": f"import {name}{i}\n" for i in range(20)})
+        for name in ("alpha", "beta")
+    ]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        maps = list(pool.map(lambda r: codemap.generate_map(str(r), use_cache=True), roots))
+    assert maps == [codemap.generate_map(str(r)) for r in roots]
+
+    files = sorted(cache_dir.glob("*.json"))
+    assert len(files) == 2
+    assert {json.loads(f.read_text())["root"] for f in files} == {str(r) for r in roots}
+
+
+def test_generate_map_streams_into_out(tmp_path):
+    make_project(tmp_path, {"main.py": '"""Entry point."""\nimport os\n'})
+    buf = io.StringIO()
+    assert codemap.generate_map(str(tmp_path), out=buf) is None
+    assert buf.getvalue() == codemap.generate_map(str(tmp_path))
+
+
+def test_generate_map_rejects_out_with_output(tmp_path):
+    with pytest.raises(ValueError):
+        codemap.generate_map(str(tmp_path), output=str(tmp_path / "map.md"), out=io.StringIO())
+    assert not (tmp_path / "map.md").exists()
+
+
 # ── Error handling tests ──────────────────────────────────────────────────────
 
 def test_missing_directory_raises():
@@ -324,6 +750,15 @@ def test_file_not_directory_raises(tmp_path):
         codemap.generate_map(str(f))
 
 
+def test_symlink_loop_is_not_reported_missing(tmp_path):
+    loop = tmp_path / "loop"
+    loop.symlink_to(loop)
+    with pytest.raises(OSError) as excinfo:
+        codemap.generate_map(str(loop))
+    assert not isinstance(excinfo.value, FileNotFoundError)
+    assert "Directory not found" not in str(excinfo.value)
+
+
 def test_cli_missing_dir():
     result = subprocess.run(
         [sys.executable, "codemap.py", "/nonexistent/path/xyz"],
@@ -369,6 +804,51 @@ def test_cli_output_file(tmp_path):
     assert "# Codebase Map:" in out.read_text()
 
 
+def test_cli_output_file_not_listed_in_its_own_map(tmp_path):
+    make_project(tmp_path, {"main.py": "pass"})
+    out = tmp_path / "CODEBASE_MAP.md"
+    result = subprocess.run(
+        [sys.executable, "codemap.py", str(tmp_path), "-o", str(out)],
+        capture_output=True, text=True
+    )
+    assert result.returncode == 0
+    assert "CODEBASE_MAP.md" not in out.read_text()
+
+
+def test_cli_failed_run_keeps_existing_output(tmp_path):
+    make_project(tmp_path, {"package.json": '{"name": 1}'})
+    out = tmp_path / "map.md"
+    out.write_text("previous map")
+    result = subprocess.run(
+        [sys.executable, "codemap.py", str(tmp_path), "--output", str(out)],
+        capture_output=True, text=True
+    )
+    assert result.returncode != 0
+    assert out.read_text() == "previous map"
+
+
+def test_cli_jobs_option(tmp_path):
+    make_project(tmp_path, {"main.py": '"""Entry point."""\nimport os\n'})
+    outputs = []
+    for jobs in ("1", "4"):
+        result = subprocess.run(
+            [sys.executable, "codemap.py", str(tmp_path), "--jobs", jobs],
+            capture_output=True, text=True
+        )
+        assert result.returncode == 0
+        outputs.append(result.stdout)
+    assert outputs[0] == outputs[1]
+    assert "Entry point." in outputs[0]
+
+
+def test_cli_jobs_rejects_zero(tmp_path):
+    result = subprocess.run(
+        [sys.executable, "codemap.py", str(tmp_path), "--jobs", "0"],
+        capture_output=True, text=True
+    )
+    assert result.returncode != 0
+
+
 # ── Stats tests ───────────────────────────────────────────────────────────────
 
 def test_count_stats(tmp_path):